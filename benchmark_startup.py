@@ -0,0 +1,79 @@
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+DIRETORIO_API = os.path.dirname(os.path.abspath(__file__))
+
+# Código executado em um processo novo a cada rodada, para medir o custo real
+# de um worker recém-criado. A primeira resposta é de uma rota autenticada que
+# usa o banco, para incluir o custo dos imports adiados para a requisição (jwt).
+# Com PRELOAD=1, preload() roda antes da requisição, como no processo mestre do
+# gunicorn --preload: nesse caso o custo de setup é pago uma vez, antes do fork.
+CODIGO_WORKER = '''
+import os
+import time
+inicio = time.perf_counter()
+import biblioteca_api
+import_fim = time.perf_counter()
+app = biblioteca_api.create_app({'RATELIMIT_ENABLED': False}, preload_app=os.environ['PRELOAD'] == '1')
+setup_fim = time.perf_counter()
+cliente = app.test_client()
+resposta = cliente.get('/api/reservas', headers={'Authorization': 'Bearer ' + os.environ['TOKEN']})
+assert resposta.status_code == 200
+fim = time.perf_counter()
+print(f'{(import_fim - inicio) * 1000:.2f} {(setup_fim - import_fim) * 1000:.2f} {(fim - setup_fim) * 1000:.2f}')
+'''
+
+def gerar_token():
+    """Gera um token de funcionário com a chave padrão da aplicação"""
+    import jwt
+    from biblioteca_api import create_app
+
+    app = create_app()
+    return jwt.encode({
+        'id': 1,
+        'email': 'admin@biblioteca.com',
+        'perfil': 'funcionario',
+        'nome': 'Admin Biblioteca'
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+
+def medir_startup(diretorio, token, preload, rodadas):
+    """Mede import, setup e primeira resposta autenticada (em ms)"""
+    env = dict(os.environ, PYTHONPATH=DIRETORIO_API, TOKEN=token, PRELOAD='1' if preload else '0')
+    medicoes = []
+
+    for _ in range(rodadas):
+        saida = subprocess.run(
+            [sys.executable, '-c', CODIGO_WORKER],
+            cwd=diretorio, env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+        medicoes.append([float(valor) for valor in saida])
+
+    return [list(coluna) for coluna in zip(*medicoes)]
+
+def imprimir(titulo, imports, setups, primeiras_respostas):
+    print(f"\n  {titulo}")
+    print(f"    Import do módulo:              mediana {statistics.median(imports):.2f} ms")
+    print(f"    create_app (+ preload):        mediana {statistics.median(setups):.2f} ms")
+    print(f"    1ª resposta autenticada:       mediana {statistics.median(primeiras_respostas):.2f} ms")
+
+if __name__ == '__main__':
+    rodadas = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    token = gerar_token()
+
+    # Banco temporário, para não depender nem alterar o biblioteca.db local
+    diretorio = tempfile.mkdtemp()
+    try:
+        subprocess.run(
+            [sys.executable, os.path.join(DIRETORIO_API, 'init_db.py')],
+            cwd=diretorio, capture_output=True, check=True
+        )
+
+        print(f"⏱️  Startup da API ({rodadas} rodadas)")
+        imprimir('Sem preload (jwt importado na 1ª requisição)', *medir_startup(diretorio, token, False, rodadas))
+        imprimir('Com preload (no gunicorn, o setup roda uma vez no mestre)', *medir_startup(diretorio, token, True, rodadas))
+    finally:
+        shutil.rmtree(diretorio)
@@ -1,12 +1,18 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, current_app, request, jsonify, send_file
 from functools import wraps
 from datetime import datetime
-import jwt
+import os
 import sqlite3
+import tempfile
 from werkzeug.security import generate_password_hash, check_password_hash
+from limitador import ControleAdmissao, retry_after
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'sua-chave-secreta-super-segura'
+# jwt é importado dentro das funções que o usam,
+# para que o import deste módulo continue barato em workers de vida curta
+
+DATABASE = 'biblioteca.db'
+
+bp = Blueprint('biblioteca', __name__)
 
 # =====================================================
 # FUNÇÕES AUXILIARES E DECORATORS
@@ -14,10 +20,21 @@ app.config['SECRET_KEY'] = 'sua-chave-secreta-super-segura'
 
 def get_db_connection():
     """Estabelece conexão com o banco de dados SQLite"""
-    conn = sqlite3.connect('biblioteca.db')
+    conn = sqlite3.connect(current_app.config.get('DATABASE', DATABASE))
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_controle_admissao():
+    """Retorna o controle de admissão da aplicação (None se desativado)"""
+    return current_app.extensions.get('controle_admissao')
+
+def resposta_limite_excedido(controle, motivo, segundos):
+    """Resposta 429 rápida, com Retry-After, registrando a rejeição"""
+    controle.registrar_rejeicao(motivo, request.endpoint)
+    resposta = jsonify({'mensagem': 'Muitas requisições. Tente novamente mais tarde'})
+    resposta.headers['Retry-After'] = retry_after(segundos)
+    return resposta, 429
+
 def token_required(f):
     """Decorator para proteger rotas que precisam de autenticação"""
     @wraps(f)
@@ -30,12 +47,21 @@ def token_required(f):
         if token.startswith('Bearer '):
             token = token[7:]
         
+        import jwt
+
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
             current_user = data
         except:
             return jsonify({'mensagem': 'Token inválido'}), 401
         
+        # Limite por usuário e rota
+        controle = get_controle_admissao()
+        if controle:
+            permitido, espera = controle.por_usuario.consumir((current_user['id'], request.endpoint))
+            if not permitido:
+                return resposta_limite_excedido(controle, 'usuario', espera)
+        
         return f(current_user, *args, **kwargs)
     
     return decorated
@@ -51,11 +77,55 @@ def funcionario_required(f):
     
     return decorated
 
+def limite_por_ip(nome_store='por_ip'):
+    """Decorator para limitar rotas públicas por IP de origem e rota"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            controle = get_controle_admissao()
+            if controle:
+                store = getattr(controle, nome_store)
+                permitido, espera = store.consumir((request.remote_addr, request.endpoint))
+                if not permitido:
+                    return resposta_limite_excedido(controle, nome_store, espera)
+            return f(*args, **kwargs)
+        
+        return decorated
+    
+    return decorator
+
+def limite_concorrencia(nome_limitador):
+    """Decorator que limita quantas requisições da rota executam ao mesmo tempo"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            controle = get_controle_admissao()
+            if not controle:
+                return f(*args, **kwargs)
+            
+            limitador = getattr(controle, nome_limitador)
+            if not limitador.tentar_entrar():
+                return resposta_limite_excedido(controle, nome_limitador, 1)
+            
+            try:
+                return f(*args, **kwargs)
+            finally:
+                limitador.sair()
+        
+        return decorated
+    
+    return decorator
+
+# Rotas de escrita (POST/PUT/DELETE) e exportações, que leem tabelas inteiras
+limite_escrita = limite_concorrencia('escritas')
+limite_exportacao = limite_concorrencia('exportacoes')
+
 # =====================================================
 # ROTAS DE AUTENTICAÇÃO
 # =====================================================
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
+@limite_por_ip('login')
 def login():
     """
     Rota de login - retorna token JWT
@@ -65,6 +135,8 @@ def login():
         "senha": "admin123"
     }
     """
+    import jwt
+
     data = request.get_json()
     
     if not data or not data.get('email') or not data.get('senha'):
@@ -85,7 +157,7 @@ def login():
         'email': usuario['email'],
         'perfil': usuario['perfil'],
         'nome': usuario['nome']
-    }, app.config['SECRET_KEY'], algorithm='HS256')
+    }, current_app.config['SECRET_KEY'], algorithm='HS256')
     
     return jsonify({
         'mensagem': 'Login realizado com sucesso',
@@ -102,8 +174,9 @@ def login():
 # ROTAS DE USUÁRIOS
 # =====================================================
 
-@app.route('/api/usuarios', methods=['POST'])
+@bp.route('/api/usuarios', methods=['POST'])
 @funcionario_required
+@limite_escrita
 def cadastrar_usuario(current_user):
     """
     Cadastra um novo usuário (apenas funcionários)
@@ -157,7 +230,7 @@ def cadastrar_usuario(current_user):
         }
     }), 201
 
-@app.route('/api/usuarios', methods=['GET'])
+@bp.route('/api/usuarios', methods=['GET'])
 @funcionario_required
 def listar_usuarios(current_user):
     """Lista todos os usuários (apenas funcionários)"""
@@ -178,7 +251,7 @@ def listar_usuarios(current_user):
     
     return jsonify({'usuarios': usuarios_lista}), 200
 
-@app.route('/api/usuarios/<int:usuario_id>', methods=['GET'])
+@bp.route('/api/usuarios/<int:usuario_id>', methods=['GET'])
 @token_required
 def obter_usuario(current_user, usuario_id):
     """Obtém dados de um usuário específico"""
@@ -209,8 +282,9 @@ def obter_usuario(current_user, usuario_id):
 # ROTAS DE LIVROS
 # =====================================================
 
-@app.route('/api/livros', methods=['POST'])
+@bp.route('/api/livros', methods=['POST'])
 @funcionario_required
+@limite_escrita
 def cadastrar_livro(current_user):
     """
     Cadastra um novo livro (apenas funcionários)
@@ -273,7 +347,8 @@ def cadastrar_livro(current_user):
         }
     }), 201
 
-@app.route('/api/livros', methods=['GET'])
+@bp.route('/api/livros', methods=['GET'])
+@limite_por_ip()
 def listar_livros():
     """
     Lista todos os livros (rota pública)
@@ -326,7 +401,8 @@ def listar_livros():
     
     return jsonify({'livros': livros_lista}), 200
 
-@app.route('/api/livros/<int:livro_id>', methods=['GET'])
+@bp.route('/api/livros/<int:livro_id>', methods=['GET'])
+@limite_por_ip()
 def obter_livro(livro_id):
     """Obtém dados de um livro específico (rota pública)"""
     conn = get_db_connection()
@@ -347,8 +423,9 @@ def obter_livro(livro_id):
         'quantidade_disponivel': livro['quantidade_disponivel']
     }), 200
 
-@app.route('/api/livros/<int:livro_id>', methods=['PUT'])
+@bp.route('/api/livros/<int:livro_id>', methods=['PUT'])
 @funcionario_required
+@limite_escrita
 def atualizar_livro(current_user, livro_id):
     """Atualiza dados de um livro (apenas funcionários)"""
     data = request.get_json()
@@ -391,8 +468,9 @@ def atualizar_livro(current_user, livro_id):
     
     return jsonify({'mensagem': 'Livro atualizado com sucesso'}), 200
 
-@app.route('/api/livros/<int:livro_id>', methods=['DELETE'])
+@bp.route('/api/livros/<int:livro_id>', methods=['DELETE'])
 @funcionario_required
+@limite_escrita
 def deletar_livro(current_user, livro_id):
     """Deleta um livro (apenas funcionários)"""
     conn = get_db_connection()
@@ -421,8 +499,9 @@ def deletar_livro(current_user, livro_id):
 # ROTAS DE RESERVAS
 # =====================================================
 
-@app.route('/api/reservas', methods=['POST'])
+@bp.route('/api/reservas', methods=['POST'])
 @token_required
+@limite_escrita
 def criar_reserva(current_user):
     """
     Cria uma nova reserva
@@ -489,7 +568,7 @@ def criar_reserva(current_user):
         }
     }), 201
 
-@app.route('/api/reservas', methods=['GET'])
+@bp.route('/api/reservas', methods=['GET'])
 @token_required
 def listar_reservas(current_user):
     """
@@ -543,8 +622,9 @@ def listar_reservas(current_user):
     
     return jsonify({'reservas': reservas_lista}), 200
 
-@app.route('/api/reservas/<int:reserva_id>/devolver', methods=['PUT'])
+@bp.route('/api/reservas/<int:reserva_id>/devolver', methods=['PUT'])
 @token_required
+@limite_escrita
 def devolver_livro(current_user, reserva_id):
     """Marca uma reserva como devolvida"""
     conn = get_db_connection()
@@ -586,8 +666,9 @@ def devolver_livro(current_user, reserva_id):
         'data_devolucao': data_devolucao
     }), 200
 
-@app.route('/api/reservas/<int:reserva_id>', methods=['DELETE'])
+@bp.route('/api/reservas/<int:reserva_id>', methods=['DELETE'])
 @funcionario_required
+@limite_escrita
 def cancelar_reserva(current_user, reserva_id):
     """Cancela/deleta uma reserva (apenas funcionários)"""
     conn = get_db_connection()
@@ -611,11 +692,74 @@ def cancelar_reserva(current_user, reserva_id):
     
     return jsonify({'mensagem': 'Reserva cancelada com sucesso'}), 200
 
+# =====================================================
+# ROTAS DE EXPORTAÇÃO
+# =====================================================
+
+@bp.route('/api/exportacao/<tabela>', methods=['GET'])
+@funcionario_required
+@limite_exportacao
+def exportar_dados(current_user, tabela):
+    """
+    Exporta livros, usuarios ou reservas em CSV compactado (apenas funcionários)
+    Parâmetros de query opcionais (exportação incremental):
+    - desde: último id exportado
+    O novo watermark é retornado no header X-Export-Watermark
+    """
+    from exportacao import COLUNAS, exportar_arquivo, nome_arquivo
+
+    if tabela not in COLUNAS:
+        return jsonify({'mensagem': f"Tabela inválida. Use: {', '.join(COLUNAS)}"}), 400
+    
+    desde = None
+    if request.args.get('desde'):
+        desde = request.args.get('desde', type=int)
+        if desde is None:
+            return jsonify({'mensagem': 'desde deve ser um id numérico'}), 400
+    
+    fd, caminho = tempfile.mkstemp(suffix='.csv.gz')
+    os.close(fd)
+    
+    try:
+        total, watermark = exportar_arquivo(current_app.config['DATABASE'], tabela, caminho, desde)
+        arquivo = open(caminho, 'rb')
+    except Exception:
+        os.remove(caminho)
+        raise
+    
+    resposta = send_file(
+        arquivo,
+        mimetype='application/gzip',
+        as_attachment=True,
+        download_name=nome_arquivo(tabela)
+    )
+    # Remove o arquivo temporário só depois que a resposta fecha o arquivo.
+    # Com direct_passthrough o werkzeug não chama os callbacks de call_on_close
+    resposta.direct_passthrough = False
+    resposta.call_on_close(lambda: os.remove(caminho))
+    resposta.content_length = os.path.getsize(caminho)
+    resposta.headers['X-Export-Linhas'] = str(total)
+    resposta.headers['X-Export-Watermark'] = str(watermark)
+    return resposta
+
 # =====================================================
 # ROTA DE STATUS DA API
 # =====================================================
 
-@app.route('/api/status', methods=['GET'])
+@bp.route('/api/metricas/admissao', methods=['GET'])
+@funcionario_required
+def metricas_admissao(current_user):
+    """
+    Métricas de rejeição do controle de admissão (apenas funcionários)
+    As métricas são do worker que atendeu a requisição (campo pid), não da API toda
+    """
+    controle = get_controle_admissao()
+    if not controle:
+        return jsonify({'mensagem': 'Controle de admissão desativado'}), 404
+    
+    return jsonify(controle.metricas()), 200
+
+@bp.route('/api/status', methods=['GET'])
 def status():
     """Verifica se a API está funcionando"""
     return jsonify({
@@ -628,5 +772,92 @@ def status():
 # INICIALIZAÇÃO
 # =====================================================
 
+def preload(app):
+    """
+    Pré-aquece o processo antes do fork dos workers (ex.: gunicorn --preload).
+    Importa os módulos pesados e verifica o schema uma única vez no processo
+    mestre; os workers herdam esse estado via copy-on-write.
+    Conexões SQLite não são compartilhadas entre processos: cada worker abre
+    as suas em get_db_connection().
+    """
+    import jwt  # noqa: F401
+    from init_db import schema_atualizado
+
+    # get_db_connection() criaria um banco vazio se o arquivo não existisse
+    if not os.path.exists(app.config['DATABASE']):
+        app.logger.warning('Banco de dados não encontrado. Execute: python init_db.py')
+        return app
+
+    with app.app_context():
+        conn = get_db_connection()
+        atualizado = schema_atualizado(conn)
+        conn.close()
+
+    if not atualizado:
+        app.logger.warning('Schema do banco desatualizado. Execute: python init_db.py')
+
+    return app
+
+def processos_configurados():
+    """Lê o número de workers de WEB_CONCURRENCY (mínimo 1)"""
+    valor = os.environ.get('WEB_CONCURRENCY', '1')
+    try:
+        return max(1, int(valor))
+    except ValueError:
+        raise ValueError(f'WEB_CONCURRENCY deve ser um número inteiro de workers, recebido: {valor!r}')
+
+def create_app(config=None, preload_app=False):
+    """
+    Cria a aplicação Flask
+    - config: dicionário opcional que sobrescreve a configuração padrão
+    - preload_app: executa preload() antes de retornar a aplicação
+    Uso com gunicorn: gunicorn --preload "biblioteca_api:create_app(preload_app=True)"
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'sua-chave-secreta-super-segura'
+    app.config['DATABASE'] = DATABASE
+
+    # Número de processos (workers) que atendem a API; gunicorn também usa WEB_CONCURRENCY
+    app.config['PROCESSOS'] = processos_configurados()
+
+    # Proxies reversos confiáveis na frente da API (X-Forwarded-For); 0 desativa
+    app.config['PROXY_FIX_X_FOR'] = 0
+
+    # Controle de admissão: limites totais, divididos entre os processos
+    # (capacidade do bucket, tokens repostos por segundo)
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config['RATELIMIT_USUARIO'] = (30, 10)
+    app.config['RATELIMIT_IP'] = (60, 20)
+    app.config['RATELIMIT_LOGIN'] = (5, 0.2)
+    app.config['MAX_ESCRITAS_SIMULTANEAS'] = 4
+    app.config['MAX_EXPORTACOES_SIMULTANEAS'] = 1
+
+    if config:
+        app.config.update(config)
+
+    if app.config['RATELIMIT_ENABLED']:
+        app.extensions['controle_admissao'] = ControleAdmissao(
+            app.config['RATELIMIT_USUARIO'],
+            app.config['RATELIMIT_IP'],
+            app.config['RATELIMIT_LOGIN'],
+            app.config['MAX_ESCRITAS_SIMULTANEAS'],
+            app.config['MAX_EXPORTACOES_SIMULTANEAS'],
+            app.config['PROCESSOS']
+        )
+
+    # Sem isso, atrás de um proxy todos os clientes teriam o IP do proxy
+    if app.config['PROXY_FIX_X_FOR']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    app.register_blueprint(bp)
+
+    if preload_app:
+        preload(app)
+
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,161 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+# =====================================================
+# DEFINIÇÃO DAS EXPORTAÇÕES
+# =====================================================
+
+# Colunas exportadas por tabela (usuarios nunca inclui a senha)
+COLUNAS = {
+    'livros': ['id', 'titulo', 'autor', 'isbn', 'ano_publicacao', 'categoria',
+               'quantidade_total', 'quantidade_disponivel', 'data_cadastro'],
+    'usuarios': ['id', 'nome', 'email', 'perfil', 'telefone', 'data_cadastro'],
+    'reservas': ['id', 'usuario_id', 'livro_id', 'data_reserva', 'data_devolucao', 'status']
+}
+
+TAMANHO_LOTE = 1000
+
+ARQUIVO_WATERMARKS = 'watermarks.json'
+
+def abrir_snapshot(caminho_db):
+    """
+    Abre uma conexão somente leitura com uma transação aberta.
+    Com o banco em modo WAL, todas as consultas feitas nessa conexão enxergam
+    o mesmo estado do banco, sem bloquear as escritas da API.
+    """
+    conn = sqlite3.connect(f'file:{caminho_db}?mode=ro', uri=True, isolation_level=None)
+    conn.execute('BEGIN')
+    return conn
+
+def consulta_exportacao(tabela, desde=None):
+    """
+    Monta a consulta da tabela a partir do watermark informado.
+    O watermark é sempre o id: com AUTOINCREMENT ele é atribuído sob o lock de
+    escrita, na ordem dos commits. data_reserva não serve como cursor, pois é
+    calculada antes do INSERT (e em horário local, sujeito ao horário de verão).
+    """
+    query = f"SELECT {', '.join(COLUNAS[tabela])} FROM {tabela}"
+    params = []
+
+    if desde:
+        query += ' WHERE id > ?'
+        params.append(desde)
+    query += ' ORDER BY id'
+
+    return query, params
+
+def exportar_tabela(conn, tabela, destino, desde=None):
+    """
+    Exporta uma tabela para CSV compactado (gzip), lendo em lotes.
+    Retorna o número de linhas exportadas e o novo watermark.
+    """
+    if tabela not in COLUNAS:
+        raise ValueError(f'Tabela inválida: {tabela}')
+
+    query, params = consulta_exportacao(tabela, desde)
+    cursor = conn.execute(query, params)
+    colunas = COLUNAS[tabela]
+    total = 0
+    watermark = desde or 0
+
+    with gzip.open(destino, 'wt', newline='', encoding='utf-8') as arquivo:
+        writer = csv.writer(arquivo)
+        writer.writerow(colunas)
+
+        while True:
+            lote = cursor.fetchmany(TAMANHO_LOTE)
+            if not lote:
+                break
+
+            writer.writerows(lote)
+            total += len(lote)
+            watermark = lote[-1][0]
+
+    return total, watermark
+
+def exportar_arquivo(caminho_db, tabela, destino, desde=None):
+    """Exporta uma única tabela a partir de um snapshot próprio"""
+    conn = abrir_snapshot(caminho_db)
+    try:
+        return exportar_tabela(conn, tabela, destino, desde)
+    finally:
+        conn.execute('COMMIT')
+        conn.close()
+
+def nome_arquivo(tabela):
+    return f"{tabela}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.csv.gz"
+
+def carregar_watermarks(diretorio):
+    caminho = os.path.join(diretorio, ARQUIVO_WATERMARKS)
+    if not os.path.exists(caminho):
+        return {}
+
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+def salvar_watermarks(diretorio, watermarks):
+    caminho = os.path.join(diretorio, ARQUIVO_WATERMARKS)
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(watermarks, arquivo, indent=2)
+
+def exportar(caminho_db, diretorio, tabelas=None, incremental=False):
+    """
+    Exporta as tabelas para o diretório a partir de um único snapshot.
+    Com incremental=True, exporta apenas o que surgiu desde a última
+    exportação. Em ambos os modos, o arquivo de watermarks do diretório é
+    atualizado apenas para as tabelas exportadas nesta execução.
+    """
+    tabelas = tabelas or list(COLUNAS)
+    os.makedirs(diretorio, exist_ok=True)
+
+    watermarks = carregar_watermarks(diretorio)
+    resultado = []
+
+    conn = abrir_snapshot(caminho_db)
+    try:
+        for tabela in tabelas:
+            destino = os.path.join(diretorio, nome_arquivo(tabela))
+            desde = watermarks.get(tabela) if incremental else None
+            total, watermark = exportar_tabela(conn, tabela, destino, desde)
+            watermarks[tabela] = watermark
+
+            # Sem registros novos, não deixa um arquivo só com o cabeçalho
+            if incremental and total == 0:
+                os.remove(destino)
+                destino = None
+
+            resultado.append({'tabela': tabela, 'arquivo': destino, 'linhas': total})
+    finally:
+        conn.execute('COMMIT')
+        conn.close()
+
+    salvar_watermarks(diretorio, watermarks)
+    return resultado
+
+# =====================================================
+# LINHA DE COMANDO
+# =====================================================
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Exporta livros, usuários e reservas para CSV compactado')
+    parser.add_argument('tabelas', nargs='*', help=f"Tabelas a exportar: {', '.join(COLUNAS)} (padrão: todas)")
+    parser.add_argument('--banco', default='biblioteca.db', help='Caminho do banco SQLite')
+    parser.add_argument('--destino', default='exportacoes', help='Diretório de saída')
+    parser.add_argument('--incremental', action='store_true', help='Exporta apenas registros novos desde a última exportação')
+    args = parser.parse_args()
+
+    invalidas = [tabela for tabela in args.tabelas if tabela not in COLUNAS]
+    if invalidas:
+        parser.error(f"Tabela inválida: {', '.join(invalidas)}")
+
+    for item in exportar(args.banco, args.destino, args.tabelas, args.incremental):
+        if item['arquivo']:
+            print(f"📦 {item['tabela']}: {item['linhas']} linhas -> {item['arquivo']}")
+        else:
+            print(f"📦 {item['tabela']}: nenhum registro novo")
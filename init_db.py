@@ -1,12 +1,36 @@
 import sqlite3
-from werkzeug.security import generate_password_hash
 
-def init_db():
-    """Inicializa o banco de dados criando as tabelas e inserindo dados iniciais"""
+# Incrementar sempre que o DDL abaixo mudar
+SCHEMA_VERSION = 2
+
+def schema_atualizado(conn):
+    """Verifica, via PRAGMA user_version, se o schema já está na versão atual"""
+    versao = conn.execute('PRAGMA user_version').fetchone()[0]
+    return versao >= SCHEMA_VERSION
+
+def init_db(forcar=False):
+    """
+    Inicializa o banco de dados criando as tabelas e inserindo dados iniciais
+    - forcar: reaplica o schema e os dados de exemplo mesmo com user_version atual.
+      Não apaga nada: tabelas e registros existentes são mantidos
+      (CREATE TABLE IF NOT EXISTS / INSERT OR IGNORE) e user_version é regravado.
+    """
     
     conn = sqlite3.connect('biblioteca.db')
+    
+    # Evita recriar o schema e recalcular os hashes das senhas a cada execução
+    if not forcar and schema_atualizado(conn):
+        conn.close()
+        print("✅ Banco de dados já está na versão atual, nada a fazer")
+        return
+    
+    from werkzeug.security import generate_password_hash
+    
     cursor = conn.cursor()
     
+    # Modo WAL: leituras longas (ex.: exportações) não bloqueiam as escritas da API
+    cursor.execute('PRAGMA journal_mode = WAL')
+    
     # Tabela de usuários
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS usuarios (
@@ -75,6 +99,8 @@ def init_db():
         ('Código Limpo em Python', 'Mariano Anaya', '978-8575228999', 2020, 'Tecnologia', 2, 2)
     ''')
     
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    
     conn.commit()
     conn.close()
     
@@ -89,4 +115,5 @@ def init_db():
     print("\n📚 8 livros de exemplo foram cadastrados")
 
 if __name__ == '__main__':
-    init_db()
\ No newline at end of file
+    import sys
+    init_db(forcar='--forcar' in sys.argv)
\ No newline at end of file
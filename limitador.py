@@ -0,0 +1,150 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+
+# =====================================================
+# TOKEN BUCKETS
+# =====================================================
+
+class BucketStore:
+    """
+    Armazena token buckets por chave (usuário, IP, rota...)
+    - capacidade: máximo de tokens (tamanho da rajada permitida)
+    - taxa: tokens repostos por segundo
+    Cada bucket ocupa apenas [tokens, ultimo_acesso]. Um bucket que já teria
+    se reenchido por completo é equivalente a um bucket novo, então é removido
+    na limpeza periódica, mantendo a memória proporcional aos clientes ativos.
+    """
+
+    LIMPEZA_A_CADA = 1024
+
+    def __init__(self, capacidade, taxa):
+        self.capacidade = float(capacidade)
+        self.taxa = float(taxa)
+        self.expiracao = self.capacidade / self.taxa
+        self._buckets = {}
+        self._operacoes = 0
+        self._lock = threading.Lock()
+
+    def consumir(self, chave, agora=None):
+        """Consome um token. Retorna (permitido, segundos para tentar de novo)"""
+        if agora is None:
+            agora = time.monotonic()
+
+        with self._lock:
+            self._operacoes += 1
+            if self._operacoes >= self.LIMPEZA_A_CADA:
+                self._limpar(agora)
+
+            bucket = self._buckets.get(chave)
+            if bucket is None:
+                bucket = self._buckets[chave] = [self.capacidade, agora]
+            else:
+                decorrido = agora - bucket[1]
+                bucket[0] = min(self.capacidade, bucket[0] + decorrido * self.taxa)
+                bucket[1] = agora
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0
+
+            return False, (1 - bucket[0]) / self.taxa
+
+    def _limpar(self, agora):
+        """Remove buckets ociosos há tempo suficiente para estarem cheios"""
+        self._operacoes = 0
+        expirados = [
+            chave for chave, (_, ultimo_acesso) in self._buckets.items()
+            if agora - ultimo_acesso >= self.expiracao
+        ]
+        for chave in expirados:
+            del self._buckets[chave]
+
+    def __len__(self):
+        return len(self._buckets)
+
+# =====================================================
+# LIMITE DE CONCORRÊNCIA
+# =====================================================
+
+class LimitadorConcorrencia:
+    """
+    Limita o número de requisições executando ao mesmo tempo.
+    Não enfileira: se não houver vaga, a requisição é rejeitada na hora,
+    evitando que a sobrecarga vire espera por lock no SQLite.
+    - compartilhado: usa um semáforo entre processos. Para valer entre os
+      workers, precisa ser criado antes do fork (gunicorn --preload).
+      Se um worker morrer segurando uma vaga (ex.: timeout do gunicorn),
+      a vaga só é recuperada ao reiniciar o processo mestre.
+    """
+
+    def __init__(self, maximo, compartilhado=False):
+        self.maximo = maximo
+        if compartilhado:
+            self._semaforo = multiprocessing.BoundedSemaphore(maximo)
+        else:
+            self._semaforo = threading.BoundedSemaphore(maximo)
+
+    def tentar_entrar(self):
+        return self._semaforo.acquire(False)
+
+    def sair(self):
+        self._semaforo.release()
+
+# =====================================================
+# CONTROLE DE ADMISSÃO
+# =====================================================
+
+def limite_por_processo(limite, processos):
+    """Divide um limite (capacidade, taxa) total entre os processos da aplicação"""
+    capacidade, taxa = limite
+    return max(1, capacidade / processos), taxa / processos
+
+class ControleAdmissao:
+    """
+    Agrupa os limitadores da aplicação e as métricas de rejeição.
+    Os limites de concorrência (escritas e exportações) usam semáforos
+    compartilhados entre os workers criados a partir deste processo.
+    Os token buckets e as métricas ficam na memória de cada processo: com
+    N workers, cada um recebe 1/N dos limites totais configurados
+    (processos=N), para que a soma entre os workers respeite o total.
+    """
+
+    def __init__(self, limite_usuario, limite_ip, limite_login, max_escritas, max_exportacoes, processos=1):
+        processos = max(1, processos)
+        self.por_usuario = BucketStore(*limite_por_processo(limite_usuario, processos))
+        self.por_ip = BucketStore(*limite_por_processo(limite_ip, processos))
+        self.login = BucketStore(*limite_por_processo(limite_login, processos))
+        self.escritas = LimitadorConcorrencia(max_escritas, compartilhado=True)
+        self.exportacoes = LimitadorConcorrencia(max_exportacoes, compartilhado=True)
+        self.rejeicoes = Counter()
+        self._lock = threading.Lock()
+
+    def registrar_rejeicao(self, motivo, rota):
+        with self._lock:
+            self.rejeicoes[(motivo, rota)] += 1
+
+    def metricas(self):
+        """Retorna as rejeições por motivo e rota, e o tamanho dos stores (deste processo)"""
+        with self._lock:
+            rejeicoes = [
+                {'motivo': motivo, 'rota': rota, 'total': total}
+                for (motivo, rota), total in sorted(self.rejeicoes.items())
+            ]
+
+        return {
+            'pid': os.getpid(),
+            'rejeicoes': rejeicoes,
+            'buckets_ativos': {
+                'usuario': len(self.por_usuario),
+                'ip': len(self.por_ip),
+                'login': len(self.login)
+            }
+        }
+
+def retry_after(segundos):
+    """Converte o tempo de espera para o valor inteiro do header Retry-After"""
+    return str(max(1, math.ceil(segundos)))